@@ -15,8 +15,6 @@ import logging
 import re
 from email.utils import parsedate_to_datetime
 
-import jinja2
-
 from imapautofiler import i18n, lookup
 
 
@@ -60,8 +58,24 @@ class Action(metaclass=abc.ABCMeta):
         raise NotImplementedError()
 
 
-def _render(template_text, message):
-    template = jinja2.Template(template_text)
+# Text without any of these delimiters renders to itself.
+_TEMPLATE_DIRECTIVE = re.compile(r"\{[{%#]")
+
+
+def _compile_template(template_text):
+    "Return a jinja2 template, or None if the text has no directives."
+    if template_text is None or not _TEMPLATE_DIRECTIVE.search(template_text):
+        return None
+    # jinja2 is slow to import and most configurations only use static
+    # mailbox names, so only load it when a template needs it.
+    import jinja2
+
+    return jinja2.Template(template_text)
+
+
+def _render(template, template_text, message):
+    if template is None:
+        return template_text
     headers = {
         name.lower().replace("-", "_"): i18n.get_header_value(message, name)
         for name in message.keys()
@@ -99,9 +113,11 @@ class Move(Action):
 
     def __init__(self, action_data, cfg):
         super().__init__(action_data, cfg)
+        self._dest_mailbox_template = _compile_template(self._data.get("dest-mailbox"))
 
     def _get_dest_mailbox(self, message_id, message):
         return _render(
+            self._dest_mailbox_template,
             self._data.get("dest-mailbox"),
             message,
         )
@@ -172,6 +188,7 @@ class Sort(Action):
             raise ValueError(
                 "No dest-mailbox-base given for action {}".format(action_data)
             )
+        self._dest_mailbox_base_template = _compile_template(self._dest_mailbox_base)
         self._dest_mailbox_regex = re.compile(
             self._data.get("dest-mailbox-regex", self._default_regex)
         )
@@ -216,7 +233,7 @@ class Sort(Action):
             self._dest_mailbox_regex_group,
         )
         return "{}{}".format(
-            _render(self._dest_mailbox_base, message),
+            _render(self._dest_mailbox_base_template, self._dest_mailbox_base, message),
             match.groups()[self._dest_mailbox_regex_group],
         )
 
@@ -53,23 +53,45 @@ def process_rules(cfg, debug, conn, dry_run=False):
     num_messages = 0
     num_processed = 0
     num_errors = 0
+    # The level does not change while the rules run, so check it once.
+    # With debug output on, the rule tree is walked with check() so each
+    # comparison is logged and shows why a rule did or did not match.
+    # Otherwise the faster compiled predicates are used.
+    log_messages = LOG.isEnabledFor(logging.DEBUG)
 
     for mailbox in cfg["mailboxes"]:
         mailbox_name = mailbox["name"]
         LOG.info("starting mailbox %r", mailbox_name)
 
-        mailbox_rules = [rules.factory(r, cfg) for r in mailbox["rules"]]
+        mailbox_rules = []
+        for rule_data in mailbox["rules"]:
+            rule = rules.factory(rule_data, cfg)
+            predicate = None if log_messages else rules.compile_rule(rule)
+            mailbox_rules.append((rule, predicate))
+        # Actions are built the first time their rule matches and then
+        # reused, so their templates are not compiled for every message.
+        rule_actions = {}
 
         for msg_id, message in conn.mailbox_iterate(mailbox_name):
             num_messages += 1
             if debug:
                 print(message.as_string().rstrip())
-            else:
+            elif log_messages:
                 LOG.debug("message %s: %s", msg_id, message["subject"])
 
-            for rule in mailbox_rules:
-                if rule.check(message):
-                    action = actions.factory(rule.get_action(), cfg)
+            # Shared by all of the rules so each header is decoded once.
+            cache = {}
+            for rule, predicate in mailbox_rules:
+                if log_messages:
+                    matched = rule.check(message)
+                else:
+                    matched = predicate(message, cache)
+                if matched:
+                    action = rule_actions.get(rule)
+                    if action is None:
+                        action = rule_actions[rule] = actions.factory(
+                            rule.get_action(), cfg
+                        )
                     try:
                         action.report(conn, mailbox_name, msg_id, message)
                         if not dry_run:
@@ -27,6 +27,10 @@ from .config import tobool
 
 LOG = logging.getLogger("imapautofiler.client")
 
+# Only the headers are fetched from the server, so there is no body to
+# parse.
+_HEADER_PARSER = email.parser.BytesHeaderParser()
+
 
 def open_connection(cfg):
     "Open a connection to the mail server."
@@ -186,10 +190,8 @@ class IMAPClient(Client):
         self._conn.select_folder(mailbox_name)
         msg_ids = self._conn.search(["ALL"])
         for msg_id in msg_ids:
-            email_parser = email.parser.BytesFeedParser()
             response = self._conn.fetch([msg_id], ["BODY.PEEK[HEADER]"])
-            email_parser.feed(response[msg_id][b"BODY[HEADER]"])
-            message = email_parser.close()
+            message = _HEADER_PARSER.parsebytes(response[msg_id][b"BODY[HEADER]"])
             yield (msg_id, message)
 
     def _ensure_mailbox(self, name):
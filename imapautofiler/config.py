@@ -17,6 +17,11 @@ import yaml
 
 LOG = logging.getLogger(__name__)
 
+_TRUE_STRINGS = frozenset(("y", "yes", "t", "true", "on", "enabled", "1"))
+
+# Use the libyaml parser when PyYAML was built with it.
+_SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 def get_config(filename):
     """Return the configuration data.
@@ -31,7 +36,7 @@ def get_config(filename):
     filename = os.path.expanduser(filename)
     LOG.debug("loading config from %s", filename)
     with open(filename, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+        return yaml.load(f, Loader=_SafeLoader)
 
 
 def tobool(value):
@@ -39,4 +44,4 @@ def tobool(value):
     if isinstance(value, bool):
         return value
 
-    return str(value).lower() in ("y", "yes", "t", "true", "on", "enabled", "1")
+    return str(value).lower() in _TRUE_STRINGS
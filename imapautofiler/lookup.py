@@ -12,18 +12,22 @@
 
 
 def _all_subclasses(cls):
-    direct = cls.__subclasses__()
-    yield from direct
-    for d in direct:
-        yield from _all_subclasses(d)
+    # Depth-first, listing each class's direct subclasses before
+    # descending into them, without recursive generator frames.
+    pending = [cls]
+    while pending:
+        direct = pending.pop().__subclasses__()
+        yield from direct
+        pending.extend(reversed(direct))
 
 
 def make_lookup_table(cls, attr_name):
-    table = {
-        getattr(subcls, attr_name, None): subcls
-        for subcls in _all_subclasses(cls)
-        if getattr(subcls, attr_name, None)
-    }
-    if getattr(cls, attr_name, None):
-        table[getattr(cls, attr_name)] = cls
+    table = {}
+    for subcls in _all_subclasses(cls):
+        name = getattr(subcls, attr_name, None)
+        if name:
+            table[name] = subcls
+    name = getattr(cls, attr_name, None)
+    if name:
+        table[name] = cls
     return table
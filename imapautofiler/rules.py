@@ -11,20 +11,43 @@
 #    under the License.
 
 import abc
+import functools
 import logging
 import re
+import sys
 from datetime import datetime, timedelta, timezone
 from email.utils import parsedate_to_datetime
 
-from imapautofiler import i18n, lookup
+from imapautofiler import i18n
+
+_lookup_table = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_regex(pattern):
+    "Compile pattern, sharing the result between rules that use it."
+    return re.compile(pattern)
+
+
+def register(cls):
+    """Class decorator adding a rule type to the factory lookup table.
+
+    The rule is registered under the value of its ``NAME`` attribute.
+
+    """
+    _lookup_table[cls.NAME] = cls
+    return cls
 
 
 class Rule(metaclass=abc.ABCMeta):
     "Base class"
 
+    __slots__ = ("_data", "_cfg", "_action")
     _log = logging.getLogger(__name__)
 
     NAME = None
+    COST = 1  # relative cost of check(), used to order sub-rules
+    PURE = False  # whether check() has no side effects and can be reordered
 
     def __init__(self, rule_data, cfg):
         """Initialize the rule.
@@ -38,6 +61,7 @@ class Rule(metaclass=abc.ABCMeta):
         self._log.debug("rule %r", rule_data)
         self._data = rule_data
         self._cfg = cfg
+        self._action = rule_data.get("action", {})
 
     @abc.abstractmethod
     def check(self, message):
@@ -52,9 +76,33 @@ class Rule(metaclass=abc.ABCMeta):
         raise NotImplementedError()
 
     def get_action(self):
-        return self._data.get("action", {})
+        return self._action
+
+    @property
+    def cost(self):
+        "Return the relative cost of checking the rule."
+        return self.COST
+
+    @property
+    def pure(self):
+        "Return whether the rule can be checked out of configuration order."
+        return self.PURE
 
+    def emit(self, ns):
+        """Return a Python expression that evaluates the rule for ``msg``.
 
+        :param ns: namespace holding values referenced by the expression
+        :type ns: dict
+
+        The default implementation calls :meth:`check`. Subclasses
+        override it to produce inline code so :func:`compile_rule` can
+        fuse a whole rule tree into one function.
+
+        """
+        return "{}(msg)".format(_bind(ns, self.check))
+
+
+@register
 class Or(Rule):
     """True if any one of the sub-rules is true.
 
@@ -65,20 +113,43 @@ class Or(Rule):
 
     """
 
+    __slots__ = ("_sub_rules",)
     NAME = "or"
     _log = logging.getLogger(NAME)
 
     def __init__(self, rule_data, cfg):
         super().__init__(rule_data, cfg)
-        self._sub_rules = [factory(r, cfg) for r in rule_data["or"].get("rules", [])]
+        self._sub_rules = tuple(
+            _merge_header_rules(
+                [factory(r, cfg) for r in rule_data["or"].get("rules", [])],
+                cfg,
+            )
+        )
 
     def check(self, message):
         if not self._sub_rules:
             self._log.debug("no sub-rules")
             return False
-        return any(r.check(message) for r in self._sub_rules)
+        for r in self._sub_rules:
+            if r.check(message):
+                return True
+        return False
+
+    @property
+    def cost(self):
+        return sum(r.cost for r in self._sub_rules)
+
+    @property
+    def pure(self):
+        return all(r.pure for r in self._sub_rules)
+
+    def emit(self, ns):
+        if not self._sub_rules:
+            return "False"
+        return "({})".format(" or ".join(r.emit(ns) for r in self._sub_rules))
 
 
+@register
 class And(Rule):
     """True if all of the sub-rules are true.
 
@@ -89,20 +160,40 @@ class And(Rule):
 
     """
 
+    __slots__ = ("_sub_rules",)
     NAME = "and"
     _log = logging.getLogger(NAME)
 
     def __init__(self, rule_data, cfg):
         super().__init__(rule_data, cfg)
-        self._sub_rules = [factory(r, cfg) for r in rule_data["and"].get("rules", [])]
+        self._sub_rules = tuple(
+            _cheap_first([factory(r, cfg) for r in rule_data["and"].get("rules", [])])
+        )
 
     def check(self, message):
         if not self._sub_rules:
             self._log.debug("no sub-rules")
             return False
-        return all(r.check(message) for r in self._sub_rules)
+        for r in self._sub_rules:
+            if not r.check(message):
+                return False
+        return True
+
+    @property
+    def cost(self):
+        return sum(r.cost for r in self._sub_rules)
+
+    @property
+    def pure(self):
+        return all(r.pure for r in self._sub_rules)
+
+    def emit(self, ns):
+        if not self._sub_rules:
+            return "False"
+        return "({})".format(" and ".join(r.emit(ns) for r in self._sub_rules))
 
 
+@register
 class Recipient(Or):
     """True if any recipient sub-rule matches.
 
@@ -112,6 +203,7 @@ class Recipient(Or):
 
     """
 
+    __slots__ = ()
     NAME = "recipient"
     _log = logging.getLogger(NAME)
 
@@ -128,6 +220,7 @@ class Recipient(Or):
         super().__init__(rule_data, cfg)
 
 
+@register
 class Headers(Rule):
     """True if all of the headers match.
 
@@ -139,63 +232,100 @@ class Headers(Rule):
 
     """
 
+    __slots__ = ("_matchers",)
     NAME = "headers"
     _log = logging.getLogger(NAME)
 
     def __init__(self, rule_data, cfg):
         super().__init__(rule_data, cfg)
-        self._matchers = []
+        matchers = []
         for header in rule_data.get("headers", []):
             if "substring" in header:
-                self._matchers.append(HeaderSubString(header, cfg))
+                matchers.append(HeaderSubString(header, cfg))
             elif "regex" in header:
-                self._matchers.append(HeaderRegex(header, cfg))
+                matchers.append(HeaderRegex(header, cfg))
             elif "value" in header:
-                self._matchers.append(HeaderExactValue(header, cfg))
+                matchers.append(HeaderExactValue(header, cfg))
             else:
                 raise ValueError("unknown header matcher {!r}".format(header))
+        self._matchers = tuple(matchers)
 
     def check(self, message):
         if not self._matchers:
             self._log.debug("no sub-rules")
             return False
-        return all(m.check(message) for m in self._matchers)
+        cache = {}
+        for m in self._matchers:
+            if not m.check(message, cache):
+                return False
+        return True
+
+    @property
+    def cost(self):
+        return sum(m.cost for m in self._matchers)
+
+    @property
+    def pure(self):
+        return all(m.pure for m in self._matchers)
+
+    def emit(self, ns):
+        if not self._matchers:
+            return "False"
+        return "({})".format(" and ".join(m.emit(ns) for m in self._matchers))
 
 
 class _HeaderMatcher(Rule):
+    __slots__ = ("_header_name", "_value")
     _log = logging.getLogger("header")
     NAME = None  # matchers cannot be used directly
+    COST = 2
+    PURE = True
+    _lowercase = True  # whether _check_rule expects a lowercase value
 
     def __init__(self, rule_data, cfg):
         super().__init__(rule_data, cfg)
-        self._header_name = rule_data["name"]
+        # Header lookups ignore case, so a lower case name gives every
+        # spelling of a header the same entry in the value cache.
+        self._header_name = sys.intern(rule_data["name"].lower())
         self._value = rule_data.get("value", "").lower()
 
     @abc.abstractmethod
     def _check_rule(self, header_value):
         "run the rule-specific matching check"
 
-    def check(self, message):
-        header_value = i18n.get_header_value(message, self._header_name)
+    def check(self, message, cache=None):
+        """Test the rule on the message.
+
+        :param message: the message object to process
+        :type message: email.message.Message
+        :param cache: header values already decoded for this message
+        :type cache: dict
+
+        """
+        if cache is None:
+            cache = {}
+        header_value = _header_value(message, self._header_name, self._lowercase, cache)
         return self._check_rule(header_value)
 
 
 class HeaderExactValue(_HeaderMatcher):
+    __slots__ = ()
     _log = logging.getLogger("header-exact-value")
 
-    def __init__(self, rule_data, cfg):
-        super().__init__(rule_data, cfg)
-        self._header_name = rule_data["name"]
-        self._value = rule_data.get("value", "").lower()
-
     def _check_rule(self, header_value):
         self._log.debug("%r == %r", self._value, header_value)
-        return self._value == header_value.lower()
+        return self._value == header_value
+
+    def emit(self, ns):
+        return "({!r} == hv(msg, {!r}, True, cache))".format(
+            self._value, self._header_name
+        )
 
 
 class HeaderSubString(_HeaderMatcher):
     "Implements substring matching for headers."
 
+    __slots__ = ()
     _log = logging.getLogger("header-substring")
 
     def __init__(self, rule_data, cfg):
@@ -204,42 +334,152 @@ class HeaderSubString(_HeaderMatcher):
 
     def _check_rule(self, header_value):
         self._log.debug("%r in %r", self._value, header_value)
-        return self._value in header_value.lower()
+        return self._value in header_value
+
+    def emit(self, ns):
+        return "({!r} in hv(msg, {!r}, True, cache))".format(
+            self._value, self._header_name
+        )
 
 
 class HeaderRegex(_HeaderMatcher):
     "Implements regular expression matching for headers."
 
+    __slots__ = ("_regex", "_search")
     _log = logging.getLogger("header-regex")
+    COST = 10
+    _lowercase = False
 
     def __init__(self, rule_data, cfg):
         super().__init__(rule_data, cfg)
         self._value = rule_data.get("regex", "")
-        self._regex = re.compile(self._value)
+        self._regex = _compile_regex(self._value)
+        self._search = self._regex.search
 
     def _check_rule(self, header_value):
         self._log.debug("%r matches %r", self._regex, header_value)
-        return bool(self._regex.search(header_value))
+        return self._search(header_value) is not None
+
+    def emit(self, ns):
+        return "({}(hv(msg, {!r}, False, cache)) is not None)".format(
+            _bind(ns, self._search), self._header_name
+        )
+
 
+class HeaderAnyMatch(Rule):
+    """True if any of several values, substrings or patterns match a header.
 
+    The rule data must contain a ``name`` for the header and may
+    contain ``values``, ``substrings`` and ``regexes`` lists. The rule
+    is built by :class:`Or` to replace sibling rules that each test a
+    single value, substring or pattern against the same header, so the
+    header is searched once instead of once per rule.
+
+    """
+
+    __slots__ = ("_header_name", "_values", "_substring_search", "_regex_search")
+    _log = logging.getLogger("header-any")
+    COST = 10
+    PURE = True
+
+    def __init__(self, rule_data, cfg):
+        super().__init__(rule_data, cfg)
+        self._header_name = sys.intern(rule_data["name"].lower())
+        self._substring_search = self._regex_search = None
+        self._values = frozenset(rule_data.get("values", ()))
+        substrings = rule_data.get("substrings")
+        if substrings:
+            # A value containing a longer substring also contains any
+            # shorter one found inside it, so only the shortest needles
+            # need to go into the alternation.
+            needles = []
+            for s in sorted(dict.fromkeys(substrings), key=len):
+                if not any(n in s for n in needles):
+                    needles.append(s)
+            self._substring_search = _compile_regex(
+                "|".join(re.escape(s) for s in needles)
+            ).search
+        regexes = rule_data.get("regexes")
+        if regexes:
+            joined = _join_regexes(regexes)
+            if joined is None:
+                raise ValueError(
+                    "Cannot combine regexes {!r} into one pattern".format(regexes)
+                )
+            self._regex_search = joined.search
+
+    def check(self, message, cache=None):
+        if cache is None:
+            cache = {}
+        if self._values or self._substring_search is not None:
+            header_value = _header_value(message, self._header_name, True, cache)
+            if header_value in self._values:
+                return True
+            if (
+                self._substring_search is not None
+                and self._substring_search(header_value) is not None
+            ):
+                return True
+        if self._regex_search is not None:
+            header_value = _header_value(message, self._header_name, False, cache)
+            if self._regex_search(header_value) is not None:
+                return True
+        return False
+
+    def emit(self, ns):
+        tests = []
+        if self._values:
+            tests.append(
+                "hv(msg, {!r}, True, cache) in {}".format(
+                    self._header_name, _bind(ns, self._values)
+                )
+            )
+        if self._substring_search is not None:
+            tests.append(
+                "{}(hv(msg, {!r}, True, cache)) is not None".format(
+                    _bind(ns, self._substring_search), self._header_name
+                )
+            )
+        if self._regex_search is not None:
+            tests.append(
+                "{}(hv(msg, {!r}, False, cache)) is not None".format(
+                    _bind(ns, self._regex_search), self._header_name
+                )
+            )
+        if not tests:
+            return "False"
+        return "({})".format(" or ".join(tests))
+
+
+@register
 class HeaderExists(Rule):
     "Looks for a message to have a given header."
 
+    __slots__ = ("_header_name", "_header_name_lower")
     NAME = "header-exists"
     _log = logging.getLogger(NAME)
+    PURE = True
 
     def __init__(self, rule_data, cfg):
         super().__init__(rule_data, cfg)
-        self._header_name = rule_data["name"]
+        self._header_name = sys.intern(rule_data["name"])
+        self._header_name_lower = sys.intern(self._header_name.lower())
 
-    def check(self, message):
+    def check(self, message, cache=None):
         self._log.debug("%r exists", self._header_name)
-        return self._header_name in message
+        if cache is None:
+            cache = {}
+        return self._header_name_lower in _header_names(message, cache)
+
+    def emit(self, ns):
+        return "({!r} in hn(msg, cache))".format(self._header_name_lower)
 
 
+@register
 class IsMailingList(HeaderExists):
     "Looks for a message to have a given header."
 
+    __slots__ = ()
     NAME = "is-mailing-list"
     _log = logging.getLogger(NAME)
 
@@ -249,11 +489,14 @@ class IsMailingList(HeaderExists):
         super().__init__(rule_data, cfg)
 
 
+@register
 class TimeLimit(Rule):
     """True if message is older than the specified 'age' measured
     in number of days."""
 
+    __slots__ = ("_age",)
     NAME = "time-limit"
+    COST = 5
     _log = logging.getLogger(NAME)
 
     def __init__(
@@ -290,7 +533,123 @@ class TimeLimit(Rule):
                 return 0
 
 
-_lookup_table = lookup.make_lookup_table(Rule, "NAME")
+# Patterns using back-references, named groups, conditionals or global
+# inline flags cannot be joined into an alternation without changing
+# their meaning or clashing with each other.
+_UNCOMBINABLE = re.compile(r"\\[1-9]|\(\?P[=<]|\(\?\(|\(\?[aiLmsux]+\)")
+
+
+def _join_regexes(patterns):
+    """Return one compiled alternation of the patterns, or None.
+
+    :param patterns: regular expressions to combine
+    :type patterns: list(str)
+
+    None is returned if the joined pattern does not compile or does not
+    keep every group of the separate patterns, so callers can fall back
+    to checking the patterns one at a time.
+
+    """
+    try:
+        joined = _compile_regex("|".join("(?:{})".format(p) for p in patterns))
+    except re.error:
+        return None
+    if joined.groups != sum(_compile_regex(p).groups for p in patterns):
+        return None
+    return joined
+
+
+def _cheap_first(rules):
+    """Return the rules with the cheapest ones first.
+
+    :param rules: sub-rules of an ``and`` rule
+    :type rules: list(Rule)
+
+    Only runs of pure rules are sorted by cost. Rules whose check has
+    side effects, such as logging an error, stay where the
+    configuration put them so they see the same messages as before.
+
+    """
+    result = []
+    run = []
+    for rule in rules:
+        if rule.pure:
+            run.append(rule)
+        else:
+            result.extend(sorted(run, key=lambda r: r.cost))
+            result.append(rule)
+            run = []
+    result.extend(sorted(run, key=lambda r: r.cost))
+    return result
+
+
+def _merge_header_rules(rules, cfg):
+    """Combine alternative value, substring and regex rules on a header.
+
+    :param rules: sub-rules of an ``or`` rule
+    :type rules: list(Rule)
+    :param cfg: full configuration data
+    :type cfg: dict
+
+    Each group of ``headers`` rules holding a single exact value,
+    substring or regex matcher for the same header is replaced with one
+    :class:`HeaderAnyMatch`, so the header is searched only once. If
+    the regexes of a group cannot be joined into one pattern they keep
+    their own rules.
+
+    """
+    groups = {}
+    merged = []
+    for r in rules:
+        if (
+            type(r) is Headers
+            and len(r._matchers) == 1
+            and (
+                type(r._matchers[0]) in (HeaderExactValue, HeaderSubString)
+                or (
+                    type(r._matchers[0]) is HeaderRegex
+                    and not _UNCOMBINABLE.search(r._matchers[0]._value)
+                )
+            )
+        ):
+            name = r._matchers[0]._header_name
+            if name not in groups:
+                groups[name] = []
+                merged.append(groups[name])
+            groups[name].append(r)
+        else:
+            merged.append(r)
+
+    result = []
+    for r in merged:
+        if isinstance(r, list):
+            regex_rules = [h for h in r if type(h._matchers[0]) is HeaderRegex]
+            if (
+                len(regex_rules) > 1
+                and _join_regexes([h._matchers[0]._value for h in regex_rules]) is None
+            ):
+                Or._log.debug("cannot combine %d regex rules", len(regex_rules))
+                result.extend(regex_rules)
+                r = [h for h in r if type(h._matchers[0]) is not HeaderRegex]
+        if not isinstance(r, list):
+            result.append(r)
+        elif not r:
+            continue
+        elif len(r) == 1:
+            result.append(r[0])
+        else:
+            matchers = [h._matchers[0] for h in r]
+            rule_data = {
+                "name": matchers[0]._header_name,
+                "values": [m._value for m in matchers if type(m) is HeaderExactValue],
+                "substrings": [
+                    m._value for m in matchers if type(m) is HeaderSubString
+                ],
+                "regexes": [m._value for m in matchers if type(m) is HeaderRegex],
+            }
+            Or._log.debug("combined %d rules into %r", len(r), rule_data)
+            result.append(HeaderAnyMatch(rule_data, cfg))
+    return result
 
 
 def factory(rule_data, cfg):
@@ -305,9 +664,83 @@ def factory(rule_data, cfg):
     the rule against a message.
 
     """
-    for key in rule_data:
-        if key == "action":
-            continue
-        if key in _lookup_table:
-            return _lookup_table[key](rule_data, cfg)
-    raise ValueError("Unknown rule type {!r}".format(rule_data))
+    # The first key naming a rule type, in configuration order.
+    key = next(filter(_lookup_table.__contains__, rule_data), None)
+    if key is None:
+        raise ValueError("Unknown rule type {!r}".format(rule_data))
+    return _lookup_table[key](rule_data, cfg)
+
+
+def _header_value(message, name, lowercase, cache):
+    """Return the decoded value of a header.
+
+    :param message: the message object to process
+    :type message: email.message.Message
+    :param name: the header name
+    :type name: str
+    :param lowercase: whether to convert the value to lower case
+    :type lowercase: bool
+    :param cache: values already decoded for this message
+    :type cache: dict
+
+    """
+    key = (name, lowercase)
+    value = cache.get(key)
+    if value is None:
+        value = i18n.get_header_value(message, name)
+        if lowercase:
+            value = value.lower()
+        cache[key] = value
+    return value
+
+
+def _header_names(message, cache):
+    """Return the lower case names of the headers present in a message.
+
+    :param message: the message object to process
+    :type message: email.message.Message
+    :param cache: values already computed for this message
+    :type cache: dict
+
+    """
+    names = cache.get(None)
+    if names is None:
+        names = cache[None] = frozenset(k.lower() for k in message.keys())
+    return names
+
+
+def _bind(ns, value):
+    "Store value in the code generation namespace and return its name."
+    name = "_v{}".format(len(ns))
+    ns[name] = value
+    return name
+
+
+def compile_rule(rule):
+    """Return a function that checks the rule against a message.
+
+    :param rule: the top-level rule to compile
+    :type rule: Rule
+
+    The rule tree is turned into the source for a single function, so
+    checking a message does not need to walk the tree and call
+    :meth:`Rule.check` on every node.
+
+    The function takes the message and an optional cache dict. Passing
+    the same cache to the predicates of every rule for a mailbox means
+    each header of a message is decoded and lower-cased only once.
+
+    """
+    ns = {"bool": bool, "hv": _header_value, "hn": _header_names}
+    expr = rule.emit(ns)
+    # Pass the helpers and bound values in as keyword-only defaults so
+    # the generated code reads them as locals instead of globals.
+    defaults = ", ".join("{0}={0}".format(name) for name in ns)
+    src = (
+        "def predicate(msg, cache=None, *, {}):\n"
+        "    if cache is None:\n"
+        "        cache = {{}}\n"
+        "    return bool({})\n"
+    ).format(defaults, expr)
+    exec(compile(src, "<rule {}>".format(rule.NAME), "exec"), ns)
+    return ns["predicate"]
@@ -1,8 +1,6 @@
 import logging
 import getpass
 
-import keyring
-
 LOG = logging.getLogger("imapautofiler.client")
 
 
@@ -18,8 +16,15 @@ class KeyringPasswordSecret:
     def __init__(self, hostname, username):
         self.hostname = hostname
         self.username = username
+        self._cached = None
 
     def get_password(self):
+        if self._cached:
+            return self._cached
+        # Loading keyring can start platform backends such as D-Bus, so
+        # only pay for it when a keyring password is configured.
+        import keyring
+
         password = keyring.get_password(self.hostname, self.username)
         if not password:
             LOG.debug("No keyring password; getting one interactively")
@@ -30,7 +35,8 @@ class KeyringPasswordSecret:
             )
             keyring.set_password(self.hostname, self.username, password)
 
-        return keyring.get_password(self.hostname, self.username)
+        self._cached = password
+        return password
 
 
 class AskPassword:
@@ -45,31 +51,24 @@ class AskPassword:
 def configure_providers(cfg):
     # First, we'll try for the in-config one. It's not recommended, but someone
     # may have set it.
-    try:
-        provider = FixedPasswordSecret(cfg["server"]["password"])
+    server = cfg.get("server", {})
+    password = server.get("password")
+    if password is not None:
         LOG.debug("Password provider in config as cleartext")
-    except KeyError:
-        pass
-    else:
-        yield provider
+        yield FixedPasswordSecret(password)
 
     # Second, we will try for a keyring password if configured
-    try:
-        use_keyring = cfg["server"]["use_keyring"]
-    except KeyError:
-        use_keyring = False
-
-    if use_keyring:
+    if server.get("use_keyring", False):
         LOG.debug("Password configured from keyring")
         yield KeyringPasswordSecret(
-            hostname=cfg["server"]["hostname"],
-            username=cfg["server"]["username"],
+            hostname=server["hostname"],
+            username=server["username"],
         )
 
     else:
         yield AskPassword(
-            hostname=cfg["server"]["hostname"],
-            username=cfg["server"]["username"],
+            hostname=server["hostname"],
+            username=server["username"],
         )
 
 
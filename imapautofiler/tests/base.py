@@ -10,12 +10,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import copy
 import email.parser
 import unittest
 from datetime import datetime, timedelta, timezone
 from email.header import Header
 from email.message import Message
 from email.utils import format_datetime
+from types import MappingProxyType
 
 
 def construct_message(headers):
@@ -25,57 +27,103 @@ def construct_message(headers):
     for header, value in headers.items():
         msg[header] = Header(value, encoding)
 
-    return msg.as_string()
+    return msg.as_bytes()
 
 
 date = format_datetime(datetime.now(timezone.utc))
 past_date = format_datetime(datetime.now(timezone.utc) - timedelta(days=90))
-MESSAGE = {
-    "From": "Sender Name <sender@example.com>",
-    "Content-Type": "multipart/alternative; "
-    'boundary="Apple-Mail=_F10D7C06-52F7-4F60-BEC9-4D5F29A9BFE1"',
-    "Message-Id": "<4FF56508-357B-4E73-82DE-458D3EEB2753@example.com>",
-    "Mime-Version": r"1.0 (Mac OS X Mail 9.2 \(3112\))",
-    "X-Smtp-Server": "AE35BF63-D70A-4AB0-9FAA-3F18EB9802A9",
-    "Subject": "Re: reply to previous message",
-    "Date": past_date,
-    "X-Universally-Unique-Identifier": "CC844EE1-C406-4ABA-9DA5-685759BBC15A",
-    "References": "<33509d2c-e2a7-48c0-8bf3-73b4ba352b2f@example.com>",
-    "To": "recipient1@example.com",
-    "CC": "recipient2@example.com",
-    "In-Reply-To": "<33509d2c-e2a7-48c0-8bf3-73b4ba352b2f@example.com>",
-}
-
-I18N_MESSAGE = MESSAGE.copy()
-I18N_MESSAGE.update(
+MESSAGE = MappingProxyType(
     {
+        "From": "Sender Name <sender@example.com>",
+        "Content-Type": "multipart/alternative; "
+        'boundary="Apple-Mail=_F10D7C06-52F7-4F60-BEC9-4D5F29A9BFE1"',
+        "Message-Id": "<4FF56508-357B-4E73-82DE-458D3EEB2753@example.com>",
+        "Mime-Version": r"1.0 (Mac OS X Mail 9.2 \(3112\))",
+        "X-Smtp-Server": "AE35BF63-D70A-4AB0-9FAA-3F18EB9802A9",
+        "Subject": "Re: reply to previous message",
+        "Date": past_date,
+        "X-Universally-Unique-Identifier": "CC844EE1-C406-4ABA-9DA5-685759BBC15A",
+        "References": "<33509d2c-e2a7-48c0-8bf3-73b4ba352b2f@example.com>",
+        "To": "recipient1@example.com",
+        "CC": "recipient2@example.com",
+        "In-Reply-To": "<33509d2c-e2a7-48c0-8bf3-73b4ba352b2f@example.com>",
+    }
+)
+
+I18N_MESSAGE = MappingProxyType(
+    {
+        **MESSAGE,
         "From": "Иванов Иван <sender@example.com>",
         "To": "Иванов Иван <recipient3@example.com>",
         "Subject": "Re: ответ на предыдущее сообщение",
     }
 )
 
-RECENT_MESSAGE = MESSAGE.copy()
-RECENT_MESSAGE.update(
+RECENT_MESSAGE = MappingProxyType(
     {
+        **MESSAGE,
         "Date": date,
     }
 )
 
-WITHOUT_OFFSET_MESSAGE = MESSAGE.copy()
-WITHOUT_OFFSET_MESSAGE.update(
+WITHOUT_OFFSET_MESSAGE = MappingProxyType(
     {
+        **MESSAGE,
         "Date": "Thu, 07 Sep 2000 20:57:30 -0000",
     }
 )
 
-WITHOUT_DATE_MESSAGE = MESSAGE.copy()
-WITHOUT_DATE_MESSAGE.update(
+WITHOUT_DATE_MESSAGE = MappingProxyType(
     {
+        **MESSAGE,
         "Date": "",
     }
 )
 
+# Action configurations shared by the action tests and fixtures.
+MOVE_CFG = MappingProxyType({"name": "move", "dest-mailbox": "msg-goes-here"})
+SORT_CFG = MappingProxyType(
+    {"name": "sort", "dest-mailbox-base": "lists-go-under-here."}
+)
+SORT_MAILING_LIST_CFG = MappingProxyType(
+    {"name": "sort-mailing-list", "dest-mailbox-base": "lists-go-under-here."}
+)
+SORT_MAILING_LIST_REGEX_CFG = MappingProxyType(
+    {**SORT_MAILING_LIST_CFG, "dest-mailbox-regex": r"<(.*)>"}
+)
+SORT_BY_YEAR_CFG = MappingProxyType(
+    {"name": "sort-by-year", "dest-mailbox-base": "archive-under-here/"}
+)
+TRASH_CFG = MappingProxyType({"name": "trash"})
+TRASH_MAILBOX_CFG = MappingProxyType({"trash-mailbox": "to-the-trash"})
+DELETE_CFG = MappingProxyType({"name": "delete"})
+
+_PARSER = email.parser.BytesHeaderParser()
+
+
+def parse_message(headers):
+    "Build and parse a message once, for use as a template."
+    return _PARSER.parsebytes(construct_message(headers))
+
+
+def copy_message(template):
+    """Return a copy of a template message.
+
+    The copy gets its own list of headers, so a test can add or remove
+    headers without changing the template.
+
+    """
+    msg = copy.copy(template)
+    msg._headers = list(template._headers)
+    return msg
+
+
+MESSAGE_TEMPLATE = parse_message(MESSAGE)
+I18N_MESSAGE_TEMPLATE = parse_message(I18N_MESSAGE)
+RECENT_MESSAGE_TEMPLATE = parse_message(RECENT_MESSAGE)
+WITHOUT_OFFSET_MESSAGE_TEMPLATE = parse_message(WITHOUT_OFFSET_MESSAGE)
+WITHOUT_DATE_MESSAGE_TEMPLATE = parse_message(WITHOUT_DATE_MESSAGE)
+
 
 class TestCase(unittest.TestCase):
     _msg = None
@@ -92,49 +140,29 @@ class TestCase(unittest.TestCase):
     @property
     def msg(self):
         if self._msg is None:
-            self._msg = email.parser.Parser().parsestr(construct_message(MESSAGE))
+            self._msg = copy_message(MESSAGE_TEMPLATE)
         return self._msg
 
     @property
     def i18n_msg(self):
         if self._i18n_msg is None:
-            self._i18n_msg = email.parser.Parser().parsestr(
-                construct_message(I18N_MESSAGE)
-            )
+            self._i18n_msg = copy_message(I18N_MESSAGE_TEMPLATE)
         return self._i18n_msg
 
     @property
     def recent_msg(self):
         if self._recent_msg is None:
-            self._recent_msg = email.parser.Parser().parsestr(
-                construct_message(RECENT_MESSAGE)
-            )
+            self._recent_msg = copy_message(RECENT_MESSAGE_TEMPLATE)
         return self._recent_msg
 
     @property
     def without_offset_msg(self):
         if self._without_offset_msg is None:
-            self._without_offset_msg = email.parser.Parser().parsestr(
-                construct_message(WITHOUT_OFFSET_MESSAGE)
-            )
+            self._without_offset_msg = copy_message(WITHOUT_OFFSET_MESSAGE_TEMPLATE)
         return self._without_offset_msg
 
     @property
     def without_date_msg(self):
         if self._without_date_msg is None:
-            self._without_date_msg = email.parser.Parser().parsestr(
-                construct_message(WITHOUT_DATE_MESSAGE)
-            )
+            self._without_date_msg = copy_message(WITHOUT_DATE_MESSAGE_TEMPLATE)
         return self._without_date_msg
-
-
-def pytest_generate_tests(metafunc):
-    # from https://docs.pytest.org/en/latest/example/parametrize.html#a-quick-port-of-testscenarios  # noqa
-    idlist = []
-    argvalues = []
-    for scenario in metafunc.cls.scenarios:
-        idlist.append(scenario[0])
-        items = scenario[1].items()
-        argnames = [x[0] for x in items]
-        argvalues.append(([x[1] for x in items]))
-    metafunc.parametrize(argnames, argvalues, ids=idlist, scope="class")
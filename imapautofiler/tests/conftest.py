@@ -0,0 +1,79 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest.mock as mock
+
+import pytest
+
+from imapautofiler import actions
+from imapautofiler.tests import base
+
+# Each test gets its own copy of a message because some tests modify
+# the headers. Actions do not change after they are created, so each
+# configuration is built once and shared by the tests in a module.
+
+
+@pytest.fixture
+def msg():
+    return base.copy_message(base.MESSAGE_TEMPLATE)
+
+
+@pytest.fixture
+def i18n_msg():
+    return base.copy_message(base.I18N_MESSAGE_TEMPLATE)
+
+
+@pytest.fixture
+def without_offset_msg():
+    return base.copy_message(base.WITHOUT_OFFSET_MESSAGE_TEMPLATE)
+
+
+@pytest.fixture
+def conn():
+    # A copy of a shared prototype Mock would share its child mocks, so
+    # calls recorded by one test would be seen by the next.
+    return mock.Mock()
+
+
+@pytest.fixture(scope="module")
+def move_action():
+    return actions.Move(base.MOVE_CFG, {})
+
+
+@pytest.fixture(scope="module")
+def sort_action_default():
+    return actions.Sort(base.SORT_CFG, {})
+
+
+@pytest.fixture(scope="module")
+def sortml_action_default():
+    return actions.SortMailingList(base.SORT_MAILING_LIST_CFG, {})
+
+
+@pytest.fixture(scope="module")
+def sortml_action_regex():
+    return actions.SortMailingList(base.SORT_MAILING_LIST_REGEX_CFG, {})
+
+
+@pytest.fixture(scope="module")
+def sort_by_year_action():
+    return actions.SortByYear(base.SORT_BY_YEAR_CFG, {})
+
+
+@pytest.fixture(scope="module")
+def trash_action():
+    return actions.Trash(base.TRASH_CFG, base.TRASH_MAILBOX_CFG)
+
+
+@pytest.fixture(scope="module")
+def delete_action():
+    return actions.Delete(base.DELETE_CFG, {})
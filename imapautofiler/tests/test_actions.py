@@ -10,12 +10,51 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import unittest
 import unittest.mock as mock
 
+import pytest
+
 from imapautofiler import actions
 from imapautofiler.tests import base
-from imapautofiler.tests.base import pytest_generate_tests  # noqa
+
+
+def _with_date(date):
+    "Build the test message with the given Date header, or none."
+    headers = {k: v for k, v in base.MESSAGE.items() if k != "Date"}
+    if date is not None:
+        headers["Date"] = date
+    return base.parse_message(headers)
+
+
+# Messages and destinations for sort-by-year, built once at import.
+DATE_CASES = [
+    pytest.param(
+        _with_date("Thu, 28 Dec 2023 13:47:53 -0600"),
+        "archive-under-here/2023",
+        id="valid-date",
+    ),
+    pytest.param(
+        _with_date("there is no date in this string"),
+        "archive-under-here/unparsable-date",
+        id="invalid-date",
+    ),
+    pytest.param(
+        _with_date(None),
+        "archive-under-here/unparsable-date",
+        id="no-date-header",
+    ),
+    pytest.param(
+        _with_date(""),
+        "archive-under-here/unparsable-date",
+        id="empty-date-header",
+    ),
+]
+
+
+@pytest.fixture
+def empty_lookup_table(monkeypatch):
+    monkeypatch.setattr(actions, "_lookup_table", {})
+    return actions._lookup_table
 
 
 class TestRegisteredFactories(object):
@@ -28,76 +67,68 @@ class TestRegisteredFactories(object):
         "flag",
         "unflag",
     ]
-    scenarios = [(name, {"name": name}) for name in _names]
 
-    def test_known(self, name):
-        assert name in actions._lookup_table
+    def test_known(self):
+        assert set(self._names) <= set(actions._lookup_table)
 
 
-class TestFactory(unittest.TestCase):
+class TestFactory:
     def test_unnamed(self):
-        self.assertRaises(ValueError, actions.factory, {}, {})
+        with pytest.raises(ValueError, match="unrecognized rule action"):
+            actions.factory({}, {})
 
     def test_unknown(self):
-        self.assertRaises(ValueError, actions.factory, {"name": "unknown-action"}, {})
+        with pytest.raises(ValueError, match="unrecognized rule action"):
+            actions.factory({"name": "unknown-action"}, {})
 
-    def test_lookup(self):
-        with mock.patch.object(actions, "_lookup_table", {}) as lt:
-            lt["move"] = mock.Mock()
-            actions.factory({"name": "move"}, {})
-            lt["move"].assert_called_with({"name": "move"}, {})
+    def test_lookup(self, empty_lookup_table):
+        empty_lookup_table["move"] = mock.Mock()
+        actions.factory({"name": "move"}, {})
+        empty_lookup_table["move"].assert_called_with({"name": "move"}, {})
 
 
-class TestMove(base.TestCase):
-    def test_static_mailbox_name(self):
-        m = actions.Move(
-            {"name": "move", "dest-mailbox": "msg-goes-here"},
-            {},
-        )
-        self.assertEqual(
-            "msg-goes-here",
-            m._get_dest_mailbox("id-here", self.without_offset_msg),
+@pytest.mark.parametrize(
+    "action_fixture,expected",
+    [
+        ("move_action", "msg-goes-here"),
+        ("sort_action_default", "lists-go-under-here.recipient1"),
+        ("trash_action", "to-the-trash"),
+    ],
+)
+def test_invoke_moves_message(request, action_fixture, expected, msg, conn):
+    action = request.getfixturevalue(action_fixture)
+    action.invoke(conn, "src-mailbox", "id-here", msg)
+    conn.move_message.assert_called_once_with("src-mailbox", expected, "id-here", msg)
+
+
+class TestMove:
+    def test_static_mailbox_name(self, move_action, without_offset_msg):
+        assert "msg-goes-here" == move_action._get_dest_mailbox(
+            "id-here", without_offset_msg
         )
 
-    def test_parameterized_mailbox_name(self):
+    def test_parameterized_mailbox_name(self, without_offset_msg):
         m = actions.Move(
             {"name": "move", "dest-mailbox": "archive.{{ date.year }}"},
             {},
         )
-        dest_mailbox = m._get_dest_mailbox("id-here", self.without_offset_msg)
-        self.assertEqual(
-            "archive.2000",
-            dest_mailbox,
-        )
+        dest_mailbox = m._get_dest_mailbox("id-here", without_offset_msg)
+        assert "archive.2000" == dest_mailbox
 
-    def test_invoke(self):
-        m = actions.Move(
-            {"name": "move", "dest-mailbox": "msg-goes-here"},
-            {},
-        )
-        conn = mock.Mock()
-        m.invoke(conn, "src-mailbox", "id-here", self.msg)
-        conn.move_message.assert_called_once_with(
-            "src-mailbox", "msg-goes-here", "id-here", self.msg
-        )
+    def test_static_mailbox_name_without_date(self, move_action):
+        msg = base.copy_message(base.WITHOUT_DATE_MESSAGE_TEMPLATE)
+        assert "msg-goes-here" == move_action._get_dest_mailbox("id-here", msg)
 
 
-class TestSort(base.TestCase):
+class TestSort:
     def test_create(self):
-        m = actions.Sort(
-            {"name": "sort", "dest-mailbox-base": "lists-go-under-here."},
-            {},
-        )
-        self.assertEqual("lists-go-under-here.", m._dest_mailbox_base)
-        self.assertEqual(m._default_regex, m._dest_mailbox_regex.pattern)
+        m = actions.Sort(base.SORT_CFG, {})
+        assert "lists-go-under-here." == m._dest_mailbox_base
+        assert m._default_regex == m._dest_mailbox_regex.pattern
 
     def test_create_missing_base(self):
-        self.assertRaises(
-            ValueError,
-            actions.Sort,
-            {"name": "sort"},
-            {},
-        )
+        with pytest.raises(ValueError, match="No dest-mailbox-base"):
+            actions.Sort({"name": "sort"}, {})
 
     def test_create_with_regex(self):
         m = actions.Sort(
@@ -108,20 +139,19 @@ class TestSort(base.TestCase):
             },
             {},
         )
-        self.assertEqual("lists-go-under-here.", m._dest_mailbox_base)
-        self.assertEqual(":(.*):", m._dest_mailbox_regex.pattern)
+        assert "lists-go-under-here." == m._dest_mailbox_base
+        assert ":(.*):" == m._dest_mailbox_regex.pattern
 
     def test_create_bad_regex(self):
-        self.assertRaises(
-            ValueError,
-            actions.Sort,
-            {
-                "name": "sort",
-                "dest-mailbox-base": "lists-go-under-here.",
-                "dest-mailbox-regex": ":.*:",
-            },
-            {},
-        )
+        with pytest.raises(ValueError, match="has no group"):
+            actions.Sort(
+                {
+                    "name": "sort",
+                    "dest-mailbox-base": "lists-go-under-here.",
+                    "dest-mailbox-regex": ":.*:",
+                },
+                {},
+            )
 
     def test_create_with_multi_group_regex(self):
         m = actions.Sort(
@@ -133,31 +163,17 @@ class TestSort(base.TestCase):
             },
             {},
         )
-        self.assertEqual(1, m._dest_mailbox_regex_group)
+        assert 1 == m._dest_mailbox_regex_group
 
-    def test_get_dest_mailbox_default(self):
-        m = actions.Sort(
-            {"name": "sort", "dest-mailbox-base": "lists-go-under-here."},
-            {},
-        )
-        dest = m._get_dest_mailbox("id-here", self.msg)
-        self.assertEqual(
-            "lists-go-under-here.recipient1",
-            dest,
-        )
+    def test_get_dest_mailbox_default(self, sort_action_default, msg):
+        dest = sort_action_default._get_dest_mailbox("id-here", msg)
+        assert "lists-go-under-here.recipient1" == dest
 
-    def test_get_dest_mailbox_i18n(self):
-        m = actions.Sort(
-            {"name": "sort", "dest-mailbox-base": "lists-go-under-here."},
-            {},
-        )
-        dest = m._get_dest_mailbox("id-here", self.i18n_msg)
-        self.assertEqual(
-            "lists-go-under-here.recipient3",
-            dest,
-        )
+    def test_get_dest_mailbox_i18n(self, sort_action_default, i18n_msg):
+        dest = sort_action_default._get_dest_mailbox("id-here", i18n_msg)
+        assert "lists-go-under-here.recipient3" == dest
 
-    def test_get_dest_mailbox_regex(self):
+    def test_get_dest_mailbox_regex(self, msg):
         m = actions.Sort(
             {
                 "name": "sort",
@@ -166,13 +182,10 @@ class TestSort(base.TestCase):
             },
             {},
         )
-        dest = m._get_dest_mailbox("id-here", self.msg)
-        self.assertEqual(
-            "lists-go-under-here.recipient1@example.com",
-            dest,
-        )
+        dest = m._get_dest_mailbox("id-here", msg)
+        assert "lists-go-under-here.recipient1@example.com" == dest
 
-    def test_get_dest_mailbox_template(self):
+    def test_get_dest_mailbox_template(self, without_offset_msg):
         m = actions.Sort(
             {
                 "name": "sort",
@@ -181,40 +194,19 @@ class TestSort(base.TestCase):
             },
             {},
         )
-        dest = m._get_dest_mailbox("id-here", self.without_offset_msg)
-        self.assertEqual(
-            "lists-go-under-here.2000.recipient1@example.com",
-            dest,
-        )
-
-    def test_invoke(self):
-        m = actions.Sort(
-            {"name": "sort", "dest-mailbox-base": "lists-go-under-here."},
-            {},
-        )
-        conn = mock.Mock()
-        m.invoke(conn, "src-mailbox", "id-here", self.msg)
-        conn.move_message.assert_called_once_with(
-            "src-mailbox", "lists-go-under-here.recipient1", "id-here", self.msg
-        )
+        dest = m._get_dest_mailbox("id-here", without_offset_msg)
+        assert "lists-go-under-here.2000.recipient1@example.com" == dest
 
 
-class TestSortMailingList(base.TestCase):
+class TestSortMailingList:
     def test_create(self):
-        m = actions.SortMailingList(
-            {"name": "sort-mailing-list", "dest-mailbox-base": "lists-go-under-here."},
-            {},
-        )
-        self.assertEqual("lists-go-under-here.", m._dest_mailbox_base)
-        self.assertEqual(m._default_regex, m._dest_mailbox_regex.pattern)
+        m = actions.SortMailingList(base.SORT_MAILING_LIST_CFG, {})
+        assert "lists-go-under-here." == m._dest_mailbox_base
+        assert m._default_regex == m._dest_mailbox_regex.pattern
 
     def test_create_missing_base(self):
-        self.assertRaises(
-            ValueError,
-            actions.SortMailingList,
-            {"name": "sort-mailing-list"},
-            {},
-        )
+        with pytest.raises(ValueError, match="No dest-mailbox-base"):
+            actions.SortMailingList({"name": "sort-mailing-list"}, {})
 
     def test_create_with_regex(self):
         m = actions.SortMailingList(
@@ -225,20 +217,19 @@ class TestSortMailingList(base.TestCase):
             },
             {},
         )
-        self.assertEqual("lists-go-under-here.", m._dest_mailbox_base)
-        self.assertEqual(":(.*):", m._dest_mailbox_regex.pattern)
+        assert "lists-go-under-here." == m._dest_mailbox_base
+        assert ":(.*):" == m._dest_mailbox_regex.pattern
 
     def test_create_bad_regex(self):
-        self.assertRaises(
-            ValueError,
-            actions.SortMailingList,
-            {
-                "name": "sort-mailing-list",
-                "dest-mailbox-base": "lists-go-under-here.",
-                "dest-mailbox-regex": ":.*:",
-            },
-            {},
-        )
+        with pytest.raises(ValueError, match="has no group"):
+            actions.SortMailingList(
+                {
+                    "name": "sort-mailing-list",
+                    "dest-mailbox-base": "lists-go-under-here.",
+                    "dest-mailbox-regex": ":.*:",
+                },
+                {},
+            )
 
     def test_create_with_multi_group_regex(self):
         m = actions.SortMailingList(
@@ -250,206 +241,94 @@ class TestSortMailingList(base.TestCase):
             },
             {},
         )
-        self.assertEqual(2, m._dest_mailbox_regex_group)
+        assert 2 == m._dest_mailbox_regex_group
 
-    def test_get_dest_mailbox_default(self):
-        m = actions.SortMailingList(
-            {"name": "sort-mailing-list", "dest-mailbox-base": "lists-go-under-here."},
-            {},
-        )
-        self.msg["list-id"] = "<sphinx-dev.googlegroups.com>"
-        dest = m._get_dest_mailbox("id-here", self.msg)
-        self.assertEqual(
-            "lists-go-under-here.sphinx-dev",
-            dest,
-        )
+    def test_get_dest_mailbox_default(self, sortml_action_default, msg):
+        msg["list-id"] = "<sphinx-dev.googlegroups.com>"
+        dest = sortml_action_default._get_dest_mailbox("id-here", msg)
+        assert "lists-go-under-here.sphinx-dev" == dest
 
-    def test_get_dest_mailbox_regex(self):
-        m = actions.SortMailingList(
-            {
-                "name": "sort-mailing-list",
-                "dest-mailbox-base": "lists-go-under-here.",
-                "dest-mailbox-regex": r"<(.*)>",
-            },
-            {},
-        )
-        self.msg["list-id"] = "<sphinx-dev.googlegroups.com>"
-        dest = m._get_dest_mailbox("id-here", self.msg)
-        self.assertEqual(
-            "lists-go-under-here.sphinx-dev.googlegroups.com",
-            dest,
-        )
+    def test_get_dest_mailbox_regex(self, sortml_action_regex, msg):
+        msg["list-id"] = "<sphinx-dev.googlegroups.com>"
+        dest = sortml_action_regex._get_dest_mailbox("id-here", msg)
+        assert "lists-go-under-here.sphinx-dev.googlegroups.com" == dest
 
-    def test_invoke(self):
-        m = actions.SortMailingList(
-            {
-                "name": "sort-mailing-list",
-                "dest-mailbox-base": "lists-go-under-here.",
-                "dest-mailbox-regex": r"<(.*)>",
-            },
-            {},
-        )
-        self.msg["list-id"] = "<sphinx-dev.googlegroups.com>"
-        conn = mock.Mock()
-        m.invoke(conn, "src-mailbox", "id-here", self.msg)
+    def test_invoke(self, sortml_action_regex, msg, conn):
+        msg["list-id"] = "<sphinx-dev.googlegroups.com>"
+        sortml_action_regex.invoke(conn, "src-mailbox", "id-here", msg)
         conn.move_message.assert_called_once_with(
             "src-mailbox",
             "lists-go-under-here.sphinx-dev.googlegroups.com",
             "id-here",
-            self.msg,
+            msg,
         )
 
 
-class TestSortByYear(base.TestCase):
+class TestSortByYear:
     def test_create(self):
-        m = actions.SortByYear(
-            {"name": "sort-by-year", "dest-mailbox-base": "archive-under-here/"},
-            {},
-        )
-        self.assertEqual("archive-under-here/", m._dest_mailbox_base)
-        self.assertEqual(m._default_regex, m._dest_mailbox_regex.pattern)
-
-    def test_invoke(self):
-        m = actions.SortByYear(
-            {
-                "name": "sort-by-year",
-                "dest-mailbox-base": "archive-under-here/",
-            },
-            {},
-        )
-        del self.msg["date"]
-        self.msg["date"] = "Thu, 28 Dec 2023 13:47:53 -0600"
-        conn = mock.Mock()
-        m.invoke(conn, "src-mailbox", "id-here", self.msg)
+        m = actions.SortByYear(base.SORT_BY_YEAR_CFG, {})
+        assert "archive-under-here/" == m._dest_mailbox_base
+        assert m._default_regex == m._dest_mailbox_regex.pattern
+
+    @pytest.mark.parametrize("template,expected", DATE_CASES)
+    def test_invoke(self, sort_by_year_action, conn, template, expected):
+        msg = base.copy_message(template)
+        sort_by_year_action.invoke(conn, "src-mailbox", "id-here", msg)
         conn.move_message.assert_called_once_with(
-            "src-mailbox", "archive-under-here/2023", "id-here", self.msg
+            "src-mailbox", expected, "id-here", msg
         )
 
-    def test_invalid_date(self):
-        m = actions.SortByYear(
-            {
-                "name": "sort-by-year",
-                "dest-mailbox-base": "archive-under-here/",
-            },
-            {},
-        )
-        del self.msg["date"]
-        self.msg["date"] = "there is no date in this string"
-        conn = mock.Mock()
-        m.invoke(conn, "src-mailbox", "id-here", self.msg)
-        conn.move_message.assert_called_once_with(
-            "src-mailbox", "archive-under-here/unparsable-date", "id-here", self.msg
-        )
-
-    def test_no_date_header(self):
-        m = actions.SortByYear(
-            {
-                "name": "sort-by-year",
-                "dest-mailbox-base": "archive-under-here/",
-            },
-            {},
-        )
-        del self.msg["date"]
-        conn = mock.Mock()
-        m.invoke(conn, "src-mailbox", "id-here", self.msg)
-        conn.move_message.assert_called_once_with(
-            "src-mailbox", "archive-under-here/unparsable-date", "id-here", self.msg
-        )
 
-    def test_empty_date_header(self):
-        m = actions.SortByYear(
-            {
-                "name": "sort-by-year",
-                "dest-mailbox-base": "archive-under-here/",
-            },
-            {},
-        )
-        del self.msg["date"]
-        self.msg["date"] = ""
-        conn = mock.Mock()
-        m.invoke(conn, "src-mailbox", "id-here", self.msg)
-        conn.move_message.assert_called_once_with(
-            "src-mailbox", "archive-under-here/unparsable-date", "id-here", self.msg
-        )
-
-
-class TestTrash(base.TestCase):
+class TestTrash:
     def test_create(self):
-        m = actions.Trash(
-            {"name": "trash"},
-            {"trash-mailbox": "to-the-trash"},
-        )
-        self.assertEqual("to-the-trash", m._dest_mailbox)
+        m = actions.Trash(base.TRASH_CFG, base.TRASH_MAILBOX_CFG)
+        assert "to-the-trash" == m._dest_mailbox
 
     def test_create_with_dest(self):
         m = actions.Trash(
             {"name": "trash", "dest-mailbox": "local-override"},
-            {"trash-mailbox": "to-the-trash"},
-        )
-        self.assertEqual("local-override", m._dest_mailbox)
-
-    def test_invoke(self):
-        m = actions.Trash(
-            {"name": "trash"},
-            {"trash-mailbox": "to-the-trash"},
-        )
-        conn = mock.Mock()
-        m.invoke(conn, "src-mailbox", "id-here", self.msg)
-        conn.move_message.assert_called_once_with(
-            "src-mailbox", "to-the-trash", "id-here", self.msg
+            base.TRASH_MAILBOX_CFG,
         )
+        assert "local-override" == m._dest_mailbox
 
 
-class TestDelete(base.TestCase):
-    def test_invoke(self):
-        m = actions.Delete(
-            {"name": "delete"},
-            {},
-        )
-        conn = mock.Mock()
-        m.invoke(conn, "src-mailbox", "id-here", self.msg)
-        conn.delete_message.assert_called_once_with("src-mailbox", "id-here", self.msg)
+class TestDelete:
+    def test_invoke(self, delete_action, msg, conn):
+        delete_action.invoke(conn, "src-mailbox", "id-here", msg)
+        conn.delete_message.assert_called_once_with("src-mailbox", "id-here", msg)
 
 
-class TestFlag(base.TestCase):
-    def test_flag(self):
+class TestFlag:
+    def test_flag(self, msg, conn):
         m = actions.Flag(
             {"name": "flag"},
             {},
         )
-        conn = mock.Mock()
-        m.invoke(conn, "src-mailbox", "id-here", self.msg)
-        conn.set_flagged.assert_called_once_with(
-            "src-mailbox", "id-here", self.msg, True
-        )
+        m.invoke(conn, "src-mailbox", "id-here", msg)
+        conn.set_flagged.assert_called_once_with("src-mailbox", "id-here", msg, True)
 
-    def test_unflag(self):
+    def test_unflag(self, msg, conn):
         m = actions.Unflag(
             {"name": "unflag"},
             {},
         )
-        conn = mock.Mock()
-        m.invoke(conn, "src-mailbox", "id-here", self.msg)
-        conn.set_flagged.assert_called_once_with(
-            "src-mailbox", "id-here", self.msg, False
-        )
+        m.invoke(conn, "src-mailbox", "id-here", msg)
+        conn.set_flagged.assert_called_once_with("src-mailbox", "id-here", msg, False)
 
 
-class TestMarkRead(base.TestCase):
-    def test_mark_read(self):
+class TestMarkRead:
+    def test_mark_read(self, msg, conn):
         m = actions.MarkRead(
             {"name": "mark_read"},
             {},
         )
-        conn = mock.Mock()
-        m.invoke(conn, "src-mailbox", "id-here", self.msg)
-        conn.set_read.assert_called_once_with("src-mailbox", "id-here", self.msg, True)
+        m.invoke(conn, "src-mailbox", "id-here", msg)
+        conn.set_read.assert_called_once_with("src-mailbox", "id-here", msg, True)
 
-    def test_mark_unread(self):
+    def test_mark_unread(self, msg, conn):
         m = actions.MarkUnread(
             {"name": "mark_unread"},
             {},
         )
-        conn = mock.Mock()
-        m.invoke(conn, "src-mailbox", "id-here", self.msg)
-        conn.set_read.assert_called_once_with("src-mailbox", "id-here", self.msg, False)
+        m.invoke(conn, "src-mailbox", "id-here", msg)
+        conn.set_read.assert_called_once_with("src-mailbox", "id-here", msg, False)
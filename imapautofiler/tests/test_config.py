@@ -56,21 +56,20 @@ class TestConfig(BaseConfigTest):
         self.assertTrue(self.cfg["server"]["check_hostname"])
 
     def test_check_hostname(self):
-        for val in ("y", "yes", "t", "true", "on", "enabled", "1"):
-            with self.subTest(val=val):
-                m = self._get_mock_open("server:\n check_hostname: %s" % val)
-                with mock.patch("imapautofiler.config.open", m):
-                    cfg = get_config("dummy")
-                    self.assertTrue(tobool(cfg["server"]["check_hostname"]))
-
-            with self.subTest(val='"%s"' % val):
-                m = self._get_mock_open('server:\n check_hostname: "%s"' % val)
-                with mock.patch("imapautofiler.config.open", m):
+        vals = ("y", "yes", "t", "true", "on", "enabled", "1")
+        docs = ["server:\n check_hostname: %s" % val for val in vals]
+        docs += ['server:\n check_hostname: "%s"' % val for val in vals]
+        # Build the open() mock once and only swap the data it returns.
+        m = mock.mock_open()
+        with mock.patch("imapautofiler.config.open", m):
+            for doc in docs:
+                mock.mock_open(m, read_data=doc)
+                with self.subTest(doc=doc):
                     cfg = get_config("dummy")
                     self.assertTrue(tobool(cfg["server"]["check_hostname"]))
 
     def test_tobool(self):
-        for val in (
+        truthy = (
             True,
             1,
             "1",
@@ -86,11 +85,13 @@ class TestConfig(BaseConfigTest):
             "ON",
             "enabled",
             "Enabled",
-        ):
-            with self.subTest(val=val):
-                self.assertTrue(tobool(val))
+        )
+        # Pair each value with its result so a failure names the value.
+        self.assertEqual(
+            [(val, True) for val in truthy], [(val, tobool(val)) for val in truthy]
+        )
 
-        for val in (
+        falsy = (
             False,
             0,
             "enable",
@@ -104,25 +105,24 @@ class TestConfig(BaseConfigTest):
             "NO",
             "never",
             "",
-        ):
-            with self.subTest(val=val):
-                self.assertFalse(tobool(val))
+        )
+        self.assertEqual(
+            [(val, False) for val in falsy], [(val, tobool(val)) for val in falsy]
+        )
 
 
+@mock.patch("imapclient.IMAPClient")
+@mock.patch("ssl.create_default_context")
 class TestServerConfig(BaseConfigTest):
-    def test_imapclient_config(self):
-        context = mock.Mock()
-        context_maker = mock.Mock(return_value=context)
-        with mock.patch("ssl.create_default_context", context_maker):
-            with mock.patch("imapclient.IMAPClient") as clientclass:
-                IMAPClient(self.cfg)
-                clientclass.assert_called_once_with(
-                    "example.com",
-                    use_uid=True,
-                    ssl=True,
-                    port=1234,
-                    ssl_context=context,
-                )
-                context_maker.assert_called_once_with(
-                    cafile="path/to/ca_file.pem",
-                )
+    def test_imapclient_config(self, context_maker, clientclass):
+        IMAPClient(self.cfg)
+        clientclass.assert_called_once_with(
+            "example.com",
+            use_uid=True,
+            ssl=True,
+            port=1234,
+            ssl_context=context_maker.return_value,
+        )
+        context_maker.assert_called_once_with(
+            cafile="path/to/ca_file.pem",
+        )
@@ -21,54 +21,74 @@ import fixtures
 from imapautofiler import client
 
 
+# Every test message has the same date and body.
+_DATE = email.utils.formatdate()
+_BODY = textwrap.dedent("""
+    This is the body.
+    There are 2 lines.
+    """)
+
+
 class MaildirFixture(fixtures.Fixture):
     def __init__(self, root, name):
         self._root = root
         self._path = os.path.join(root, name)
         self.name = name
+        self._mbox = mailbox.Maildir(self._path)
+
+    def _setUp(self):
+        self._mbox.lock()
+        self.addCleanup(self._mbox.unlock)
+        self.reset()
+
+    def reset(self):
+        "Remove all messages and add the initial one again."
+        for subdir in ("cur", "new"):
+            with os.scandir(os.path.join(self._path, subdir)) as entries:
+                for entry in entries:
+                    os.unlink(entry.path)
         self.make_message(subject="init maildir")
 
     def make_message(
         self, subject="subject", from_addr="from@example.com", to_addr="to@example.com"
     ):
-        mbox = mailbox.Maildir(self._path)
-        mbox.lock()
-        try:
-            msg = mailbox.MaildirMessage()
-            msg.set_unixfrom("author Sat Jul 23 15:35:34 2017")
-            msg["From"] = from_addr
-            msg["To"] = to_addr
-            msg["Subject"] = subject
-            msg["Date"] = email.utils.formatdate()
-            msg.set_payload(
-                textwrap.dedent("""
-            This is the body.
-            There are 2 lines.
-            """)
-            )
-            mbox.add(msg)
-            mbox.flush()
-        finally:
-            mbox.unlock()
+        msg = mailbox.MaildirMessage()
+        msg.set_unixfrom("author Sat Jul 23 15:35:34 2017")
+        msg["From"] = from_addr
+        msg["To"] = to_addr
+        msg["Subject"] = subject
+        msg["Date"] = _DATE
+        msg.set_payload(_BODY)
+        self._mbox.add(msg)
+        self._mbox.flush()
         return msg
 
 
 class MaildirTest(unittest.TestCase):
-    def setUp(self):
-        super().setUp()
-        self.tmpdir = self.useFixture(fixtures.TempDir()).path
-        self.src_mbox = self.useFixture(MaildirFixture(self.tmpdir, "source-mailbox"))
-        # self.msg = self.src_mbox.make_message()
-        self.dest_mbox = self.useFixture(
-            MaildirFixture(self.tmpdir, "destination-mailbox")
+    # The mailboxes are created once for the class and emptied before
+    # each test.
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmpdir = cls.useClassFixture(fixtures.TempDir()).path
+        cls.src_mbox = cls.useClassFixture(MaildirFixture(cls.tmpdir, "source-mailbox"))
+        cls.dest_mbox = cls.useClassFixture(
+            MaildirFixture(cls.tmpdir, "destination-mailbox")
         )
-        self.client = client.MaildirClient({"maildir": self.tmpdir})
 
-    def useFixture(self, f):
+    @classmethod
+    def useClassFixture(cls, f):
         f.setUp()
-        self.addCleanup(f.cleanUp)
+        cls.addClassCleanup(f.cleanUp)
         return f
 
+    def setUp(self):
+        super().setUp()
+        self.src_mbox.reset()
+        self.dest_mbox.reset()
+        self.client = client.MaildirClient({"maildir": self.tmpdir})
+
     def test_list_mailboxes(self):
         expected = set(["destination-mailbox", "source-mailbox"])
         actual = set(self.client.list_mailboxes())
@@ -76,12 +96,13 @@ class MaildirTest(unittest.TestCase):
 
     def test_mailbox_iterate(self):
         self.src_mbox.make_message(subject="added by test")
-        expected = set(["init maildir", "added by test"])
-        actual = set(
-            msg["subject"]
-            for msg_id, msg in self.client.mailbox_iterate(self.src_mbox.name)
+        self.assertCountEqual(
+            ["init maildir", "added by test"],
+            [
+                msg["subject"]
+                for msg_id, msg in self.client.mailbox_iterate(self.src_mbox.name)
+            ],
         )
-        self.assertEqual(expected, actual)
 
     def test_copy_message(self):
         self.src_mbox.make_message(subject="added by test")
@@ -95,12 +116,13 @@ class MaildirTest(unittest.TestCase):
                 msg_id,
                 msg,
             )
-        expected = set(["init maildir", "added by test"])
-        actual = set(
-            msg["subject"]
-            for msg_id, msg in self.client.mailbox_iterate(self.dest_mbox.name)
+        self.assertCountEqual(
+            ["init maildir", "added by test"],
+            [
+                msg["subject"]
+                for msg_id, msg in self.client.mailbox_iterate(self.dest_mbox.name)
+            ],
         )
-        self.assertEqual(expected, actual)
 
     def test_move_message(self):
         self.src_mbox.make_message(subject="added by test")
@@ -114,16 +136,18 @@ class MaildirTest(unittest.TestCase):
                 msg_id,
                 msg,
             )
-        expected = set(["init maildir", "added by test"])
-        actual = set(
-            msg["subject"]
-            for msg_id, msg in self.client.mailbox_iterate(self.dest_mbox.name)
+        self.assertCountEqual(
+            ["init maildir", "added by test"],
+            [
+                msg["subject"]
+                for msg_id, msg in self.client.mailbox_iterate(self.dest_mbox.name)
+            ],
         )
-        self.assertEqual(expected, actual)
         # No longer appears in source maildir
-        expected = set(["init maildir"])
-        actual = set(
-            msg["subject"]
-            for msg_id, msg in self.client.mailbox_iterate(self.src_mbox.name)
+        self.assertCountEqual(
+            ["init maildir"],
+            [
+                msg["subject"]
+                for msg_id, msg in self.client.mailbox_iterate(self.src_mbox.name)
+            ],
         )
-        self.assertEqual(expected, actual)
@@ -10,26 +10,30 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import re
+import sys
 import unittest
 import unittest.mock as mock
 
+import pytest
+
 from imapautofiler import rules
 from imapautofiler.tests import base
-from imapautofiler.tests.base import pytest_generate_tests  # noqa
 
 
 class TestRegisteredFactories(object):
-    _names = [
-        "or",
-        "and",
-        "recipient",
-        "time-limit",
-        "headers",
-        "header-exists",
-        "is-mailing-list",
-    ]
-    scenarios = [(name, {"name": name}) for name in _names]
-
+    @pytest.mark.parametrize(
+        "name",
+        [
+            "or",
+            "and",
+            "recipient",
+            "time-limit",
+            "headers",
+            "header-exists",
+            "is-mailing-list",
+        ],
+    )
     def test_known(self, name):
         assert name in rules._lookup_table
 
@@ -51,6 +55,18 @@ class TestFactory(unittest.TestCase):
         self.assertRaises(ValueError, rules.factory, {"action": {}}, {})
 
 
+class TestGetAction(unittest.TestCase):
+    def test_action(self):
+        rule_def = {"header-exists": {}, "name": "to", "action": {"name": "trash"}}
+        r = rules.factory(rule_def, {})
+        self.assertEqual({"name": "trash"}, r.get_action())
+
+    def test_no_action(self):
+        r = rules.factory({"header-exists": {}, "name": "to"}, {})
+        self.assertEqual({}, r.get_action())
+        self.assertIs(r.get_action(), r.get_action())
+
+
 class TestOr(base.TestCase):
     def test_create_recursive(self):
         rule_def = {
@@ -74,15 +90,171 @@ class TestOr(base.TestCase):
         self.assertIsInstance(r._sub_rules[1], rules.Headers)
         self.assertEqual(len(r._sub_rules), 2)
 
+    def test_combine_regexes(self):
+        rule_def = {
+            "or": {
+                "rules": [
+                    {"headers": [{"name": "subject", "regex": "^nomatch"}]},
+                    {"headers": [{"name": "to", "regex": "recipient1"}]},
+                    {"headers": [{"name": "Subject", "regex": "reply (to|from)"}]},
+                ],
+            },
+        }
+        r = rules.Or(rule_def, {})
+        self.assertEqual(len(r._sub_rules), 2)
+        self.assertIsInstance(r._sub_rules[0], rules.HeaderAnyMatch)
+        self.assertEqual(
+            ["^nomatch", "reply (to|from)"], r._sub_rules[0]._data["regexes"]
+        )
+        self.assertIsInstance(r._sub_rules[1], rules.Headers)
+        self.assertTrue(r._sub_rules[0].check(self.msg))
+
+    def test_combine_substrings_and_regexes(self):
+        rule_def = {
+            "or": {
+                "rules": [
+                    {"headers": [{"name": "subject", "regex": "^nomatch"}]},
+                    {"headers": [{"name": "subject", "substring": "[PREVIOUS]"}]},
+                    {"headers": [{"name": "subject", "substring": "Re: REPLY"}]},
+                ],
+            },
+        }
+        r = rules.Or(rule_def, {})
+        self.assertEqual(len(r._sub_rules), 1)
+        matcher = r._sub_rules[0]
+        self.assertIsInstance(matcher, rules.HeaderAnyMatch)
+        self.assertEqual(["[previous]", "re: reply"], matcher._data["substrings"])
+        self.assertTrue(matcher.check(self.msg))
+        self.assertTrue(rules.compile_rule(r)(self.msg))
+
+    def test_combine_substrings_drops_redundant(self):
+        rule_def = {
+            "or": {
+                "rules": [
+                    {"headers": [{"name": "subject", "substring": "Re: REPLY"}]},
+                    {"headers": [{"name": "subject", "substring": "[previous]"}]},
+                    {"headers": [{"name": "subject", "substring": "reply"}]},
+                    {"headers": [{"name": "subject", "substring": "reply"}]},
+                ],
+            },
+        }
+        r = rules.Or(rule_def, {})
+        matcher = r._sub_rules[0]
+        self.assertEqual(
+            r"reply|\[previous\]", matcher._substring_search.__self__.pattern
+        )
+        self.assertTrue(matcher.check(self.msg))
+
+    def test_combine_exact_values(self):
+        rule_def = {
+            "or": {
+                "rules": [
+                    {"headers": [{"name": "to", "value": "nobody@example.com"}]},
+                    {"headers": [{"name": "to", "value": "Recipient1@example.com"}]},
+                ],
+            },
+        }
+        r = rules.Or(rule_def, {})
+        self.assertEqual(len(r._sub_rules), 1)
+        matcher = r._sub_rules[0]
+        self.assertIsInstance(matcher, rules.HeaderAnyMatch)
+        self.assertEqual(
+            frozenset(["nobody@example.com", "recipient1@example.com"]),
+            matcher._values,
+        )
+        self.assertTrue(matcher.check(self.msg))
+        self.assertTrue(rules.compile_rule(r)(self.msg))
+
+    def test_combine_no_match(self):
+        rule_def = {
+            "or": {
+                "rules": [
+                    {"headers": [{"name": "subject", "regex": "^Reply"}]},
+                    {"headers": [{"name": "subject", "substring": "[previous]"}]},
+                ],
+            },
+        }
+        r = rules.Or(rule_def, {})
+        self.assertEqual(len(r._sub_rules), 1)
+        self.assertFalse(r.check(self.msg))
+        self.assertFalse(rules.compile_rule(r)(self.msg))
+
+    def test_combine_regexes_skips_backreference(self):
+        rule_def = {
+            "or": {
+                "rules": [
+                    {"headers": [{"name": "subject", "regex": "(re): \\1"}]},
+                    {"headers": [{"name": "subject", "regex": "reply"}]},
+                ],
+            },
+        }
+        r = rules.Or(rule_def, {})
+        self.assertEqual(len(r._sub_rules), 2)
+        self.assertIsInstance(r._sub_rules[0], rules.Headers)
+        self.assertIsInstance(r._sub_rules[1], rules.Headers)
+
+    def test_combine_regexes_skips_named_groups(self):
+        rule_def = {
+            "or": {
+                "rules": [
+                    {"headers": [{"name": "subject", "regex": "(?P<id>nomatch)"}]},
+                    {"headers": [{"name": "subject", "regex": "(?P<id>reply)"}]},
+                ],
+            },
+        }
+        r = rules.Or(rule_def, {})
+        self.assertEqual(len(r._sub_rules), 2)
+        self.assertTrue(r.check(self.msg))
+        self.assertTrue(rules.compile_rule(r)(self.msg))
+
+    def test_combine_regexes_skips_conditionals(self):
+        rule_def = {
+            "or": {
+                "rules": [
+                    {"headers": [{"name": "subject", "regex": "(x)?nomatch"}]},
+                    {"headers": [{"name": "subject", "regex": "(re: )?(?(1)reply)"}]},
+                ],
+            },
+        }
+        r = rules.Or(rule_def, {})
+        self.assertEqual(len(r._sub_rules), 2)
+        self.assertTrue(r.check(self.msg))
+
+    def test_combine_regexes_falls_back_when_join_fails(self):
+        rule_def = {
+            "or": {
+                "rules": [
+                    {"headers": [{"name": "subject", "substring": "nomatch"}]},
+                    {"headers": [{"name": "subject", "regex": "(?P<id>nomatch)"}]},
+                    {"headers": [{"name": "subject", "regex": "(?P<id>reply)"}]},
+                    {"headers": [{"name": "subject", "substring": "[previous]"}]},
+                ],
+            },
+        }
+        # Let the patterns past the static check to reach the fallback.
+        with mock.patch.object(rules, "_UNCOMBINABLE", re.compile("(?!)")):
+            r = rules.Or(rule_def, {})
+        self.assertEqual(
+            [rules.Headers, rules.Headers, rules.HeaderAnyMatch],
+            [type(sr) for sr in r._sub_rules],
+        )
+        self.assertTrue(r.check(self.msg))
+        self.assertTrue(rules.compile_rule(r)(self.msg))
+
+    def test_any_match_rejects_unjoinable_regexes(self):
+        rule_data = {"name": "subject", "regexes": ["(?P<id>a)", "(?P<id>b)"]}
+        with self.assertRaises(ValueError):
+            rules.HeaderAnyMatch(rule_data, {})
+
     def test_check_pass_first(self):
         rule_def = {"or": {"rules": []}}
         r = rules.Or(rule_def, {})
         r1 = mock.Mock()
         r1.check.return_value = True
-        r._sub_rules.append(r1)
+        r._sub_rules += (r1,)
         r2 = mock.Mock()
         r2.check.return_value = False
-        r._sub_rules.append(r2)
+        r._sub_rules += (r2,)
         self.assertTrue(r.check(self.msg))
 
     def test_check_short_circuit(self):
@@ -90,10 +262,10 @@ class TestOr(base.TestCase):
         r = rules.Or(rule_def, {})
         r1 = mock.Mock()
         r1.check.return_value = True
-        r._sub_rules.append(r1)
+        r._sub_rules += (r1,)
         r2 = mock.Mock()
         r2.check.side_effect = AssertionError("r2 should not be called")
-        r._sub_rules.append(r2)
+        r._sub_rules += (r2,)
         self.assertTrue(r.check(self.msg))
 
     def test_check_pass_second(self):
@@ -101,10 +273,10 @@ class TestOr(base.TestCase):
         r = rules.Or(rule_def, {})
         r1 = mock.Mock()
         r1.check.return_value = False
-        r._sub_rules.append(r1)
+        r._sub_rules += (r1,)
         r2 = mock.Mock()
         r2.check.return_value = True
-        r._sub_rules.append(r2)
+        r._sub_rules += (r2,)
         self.assertTrue(r.check(self.msg))
 
     def test_check_no_match(self):
@@ -112,10 +284,10 @@ class TestOr(base.TestCase):
         r = rules.Or(rule_def, {})
         r1 = mock.Mock()
         r1.check.return_value = False
-        r._sub_rules.append(r1)
+        r._sub_rules += (r1,)
         r2 = mock.Mock()
         r2.check.return_value = False
-        r._sub_rules.append(r2)
+        r._sub_rules += (r2,)
         self.assertFalse(r.check(self.msg))
 
     def test_check_no_subrules(self):
@@ -147,15 +319,67 @@ class TestAnd(base.TestCase):
         self.assertIsInstance(r._sub_rules[1], rules.Headers)
         self.assertEqual(len(r._sub_rules), 2)
 
+    def test_create_cheap_first(self):
+        rule_def = {
+            "and": {
+                "rules": [
+                    {"headers": [{"name": "to", "regex": "recipient.*"}]},
+                    {"headers": [{"name": "to", "substring": "recipient1"}]},
+                    {"header-exists": {}, "name": "references"},
+                ],
+            },
+        }
+        r = rules.And(rule_def, {})
+        self.assertEqual(
+            [rules.HeaderExists, rules.Headers, rules.Headers],
+            [type(sub) for sub in r._sub_rules],
+        )
+        self.assertEqual(
+            [1, 2, 10],
+            [sub.cost for sub in r._sub_rules],
+        )
+
+    def test_create_keeps_time_limit_in_place(self):
+        rule_def = {
+            "and": {
+                "rules": [
+                    {"headers": [{"name": "to", "regex": "recipient.*"}]},
+                    {"time-limit": {"age": 30}},
+                    {"headers": [{"name": "to", "substring": "recipient1"}]},
+                    {"header-exists": {}, "name": "references"},
+                ],
+            },
+        }
+        r = rules.And(rule_def, {})
+        self.assertEqual(
+            [rules.Headers, rules.TimeLimit, rules.HeaderExists, rules.Headers],
+            [type(sub) for sub in r._sub_rules],
+        )
+
+    def test_check_no_date_skips_time_limit(self):
+        rule_def = {
+            "and": {
+                "rules": [
+                    {"headers": [{"name": "subject", "regex": "^ticket"}]},
+                    {"time-limit": {"age": 30}},
+                ],
+            },
+        }
+        r = rules.And(rule_def, {})
+        with mock.patch.object(rules.TimeLimit, "_log") as log:
+            self.assertFalse(r.check(self.without_date_msg))
+            self.assertFalse(rules.compile_rule(r)(self.without_date_msg))
+        log.error.assert_not_called()
+
     def test_check_fail_one_1(self):
         rule_def = {"and": {"rules": []}}
         r = rules.And(rule_def, {})
         r1 = mock.Mock()
         r1.check.return_value = True
-        r._sub_rules.append(r1)
+        r._sub_rules += (r1,)
         r2 = mock.Mock()
         r2.check.return_value = False
-        r._sub_rules.append(r2)
+        r._sub_rules += (r2,)
         self.assertFalse(r.check(self.msg))
 
     def test_check_fail_one_2(self):
@@ -163,10 +387,10 @@ class TestAnd(base.TestCase):
         r = rules.And(rule_def, {})
         r1 = mock.Mock()
         r1.check.return_value = False
-        r._sub_rules.append(r1)
+        r._sub_rules += (r1,)
         r2 = mock.Mock()
         r2.check.return_value = True
-        r._sub_rules.append(r2)
+        r._sub_rules += (r2,)
         self.assertFalse(r.check(self.msg))
 
     def test_check_short_circuit(self):
@@ -174,10 +398,10 @@ class TestAnd(base.TestCase):
         r = rules.And(rule_def, {})
         r1 = mock.Mock()
         r1.check.return_value = False
-        r._sub_rules.append(r1)
+        r._sub_rules += (r1,)
         r2 = mock.Mock()
         r2.check.side_effect = AssertionError("r2 should not be called")
-        r._sub_rules.append(r2)
+        r._sub_rules += (r2,)
         self.assertFalse(r.check(self.msg))
 
     def test_check_pass_second(self):
@@ -185,10 +409,10 @@ class TestAnd(base.TestCase):
         r = rules.And(rule_def, {})
         r1 = mock.Mock()
         r1.check.return_value = True
-        r._sub_rules.append(r1)
+        r._sub_rules += (r1,)
         r2 = mock.Mock()
         r2.check.return_value = True
-        r._sub_rules.append(r2)
+        r._sub_rules += (r2,)
         self.assertTrue(r.check(self.msg))
 
     def test_check_no_match(self):
@@ -196,10 +420,10 @@ class TestAnd(base.TestCase):
         r = rules.And(rule_def, {})
         r1 = mock.Mock()
         r1.check.return_value = False
-        r._sub_rules.append(r1)
+        r._sub_rules += (r1,)
         r2 = mock.Mock()
         r2.check.return_value = False
-        r._sub_rules.append(r2)
+        r._sub_rules += (r2,)
         self.assertFalse(r.check(self.msg))
 
     def test_check_no_subrules(self):
@@ -291,6 +515,14 @@ class TestHeaderSubString(base.TestCase):
         r = rules.HeaderSubString(rule_def, {})
         self.assertFalse(r.check(self.msg))
 
+    def test_name_interned(self):
+        rule_def = {
+            "name": "".join(["X-", "Interned"]),
+            "substring": "recipient1@example.com",
+        }
+        r = rules.HeaderSubString(rule_def, {})
+        self.assertIs(sys.intern("x-interned"), r._header_name)
+
     def test_i18n_match(self):
         rule_def = {
             "name": "subject",
@@ -341,6 +573,23 @@ class TestHeaderRegex(base.TestCase):
         r = rules.HeaderRegex(rule_def, {})
         self.assertFalse(r.check(self.msg))
 
+    def test_shared_pattern(self):
+        rule_def = {
+            "name": "to",
+            "regex": "recipient.*@example.com",
+        }
+        r1 = rules.HeaderRegex(rule_def, {})
+        r2 = rules.HeaderRegex(dict(rule_def, name="cc"), {})
+        self.assertIs(r1._regex, r2._regex)
+
+    def test_respects_case(self):
+        rule_def = {
+            "name": "to",
+            "regex": "RECIPIENT.*@Example.com",
+        }
+        r = rules.HeaderRegex(rule_def, {})
+        self.assertFalse(r.check(self.msg))
+
     def test_i18n_match(self):
         rule_def = {
             "name": "subject",
@@ -388,6 +637,15 @@ class TestHeaderExists(base.TestCase):
         r = rules.HeaderExists(rule_def, {})
         self.assertFalse(r.check(self.msg))
 
+    def test_shares_header_names(self):
+        cache = {}
+        r1 = rules.HeaderExists({"name": "references"}, {})
+        r2 = rules.HeaderExists({"name": "no-such-header"}, {})
+        self.assertTrue(r1.check(self.msg, cache))
+        with mock.patch.object(self.msg, "keys") as keys:
+            self.assertFalse(r2.check(self.msg, cache))
+        keys.assert_not_called()
+
 
 class TestIsMailingList(base.TestCase):
     def test_yes(self):
@@ -438,23 +696,53 @@ class TestHeaders(base.TestCase):
         r = rules.Headers(rule_def, {})
         r1 = mock.Mock()
         r1.check.return_value = True
-        r._matchers.append(r1)
+        r._matchers += (r1,)
         r2 = mock.Mock()
         r2.check.return_value = True
-        r._matchers.append(r2)
+        r._matchers += (r2,)
         self.assertTrue(r.check(self.msg))
-        r1.check.assert_called_once_with(self.msg)
-        r2.check.assert_called_once_with(self.msg)
+        r1.check.assert_called_once_with(self.msg, mock.ANY)
+        r2.check.assert_called_once_with(self.msg, mock.ANY)
+
+    def test_check_shares_header_values(self):
+        rule_def = {
+            "headers": [
+                {"name": "to", "substring": "recipient1"},
+                {"name": "to", "value": "recipient1@example.com"},
+                {"name": "to", "regex": "Recipient1"},
+            ],
+        }
+        r = rules.Headers(rule_def, {})
+        with mock.patch.object(
+            rules.i18n, "get_header_value", wraps=rules.i18n.get_header_value
+        ) as ghv:
+            self.assertFalse(r.check(self.msg))
+        # one decode for the lowercase matchers and one for the regex
+        self.assertEqual(2, ghv.call_count)
+
+    def test_check_shares_header_values_any_case(self):
+        rule_def = {
+            "headers": [
+                {"name": "To", "substring": "recipient1"},
+                {"name": "to", "value": "recipient1@example.com"},
+            ],
+        }
+        r = rules.Headers(rule_def, {})
+        with mock.patch.object(
+            rules.i18n, "get_header_value", wraps=rules.i18n.get_header_value
+        ) as ghv:
+            self.assertTrue(r.check(self.msg))
+        ghv.assert_called_once_with(self.msg, "to")
 
     def test_fail_one(self):
         rule_def = {"or": {"rules": []}}
         r = rules.Headers(rule_def, {})
         r1 = mock.Mock()
         r1.check.return_value = False
-        r._matchers.append(r1)
+        r._matchers += (r1,)
         r2 = mock.Mock()
         r2.check.return_value = True
-        r._matchers.append(r2)
+        r._matchers += (r2,)
         self.assertFalse(r.check(self.msg))
 
     def test_check_no_match(self):
@@ -462,10 +750,10 @@ class TestHeaders(base.TestCase):
         r = rules.Headers(rule_def, {})
         r1 = mock.Mock()
         r1.check.return_value = False
-        r._matchers.append(r1)
+        r._matchers += (r1,)
         r2 = mock.Mock()
         r2.check.return_value = False
-        r._matchers.append(r2)
+        r._matchers += (r2,)
         self.assertFalse(r.check(self.msg))
 
     def test_check_no_matchers(self):
@@ -534,3 +822,79 @@ class TestTimeLimit(base.TestCase):
     def test_invalid_date(self):
         r = rules.TimeLimit(self.get_def(), {})
         self.assertFalse(r.check(self.without_date_msg))
+
+
+class TestCompileRule(base.TestCase):
+    def assertCompiledMatches(self, rule_def, msg):
+        r = rules.factory(rule_def, {})
+        predicate = rules.compile_rule(r)
+        self.assertEqual(bool(r.check(msg)), predicate(msg))
+        return predicate(msg)
+
+    def test_or(self):
+        rule_def = {
+            "or": {
+                "rules": [
+                    {"headers": [{"name": "to", "substring": "nobody@example.com"}]},
+                    {"headers": [{"name": "cc", "regex": "recipient2@.*"}]},
+                ],
+            },
+        }
+        self.assertTrue(self.assertCompiledMatches(rule_def, self.msg))
+
+    def test_or_no_subrules(self):
+        rule_def = {"or": {"rules": []}}
+        self.assertFalse(self.assertCompiledMatches(rule_def, self.msg))
+
+    def test_and(self):
+        rule_def = {
+            "and": {
+                "rules": [
+                    {"headers": [{"name": "to", "value": "recipient1@example.com"}]},
+                    {"header-exists": {}, "name": "references"},
+                ],
+            },
+        }
+        self.assertTrue(self.assertCompiledMatches(rule_def, self.msg))
+
+    def test_and_no_match(self):
+        rule_def = {
+            "and": {
+                "rules": [
+                    {"headers": [{"name": "to", "value": "recipient1@example.com"}]},
+                    {"is-mailing-list": {}},
+                ],
+            },
+        }
+        self.assertFalse(self.assertCompiledMatches(rule_def, self.msg))
+
+    def test_and_no_subrules(self):
+        rule_def = {"and": {"rules": []}}
+        self.assertFalse(self.assertCompiledMatches(rule_def, self.msg))
+
+    def test_headers_no_matchers(self):
+        rule_def = {"headers": []}
+        self.assertFalse(self.assertCompiledMatches(rule_def, self.msg))
+
+    def test_recipient_i18n(self):
+        rule_def = {"recipient": {"substring": "Recipient3@example.com"}}
+        self.assertTrue(self.assertCompiledMatches(rule_def, self.i18n_msg))
+
+    def test_time_limit(self):
+        rule_def = {"time-limit": {"age": 30}}
+        self.assertTrue(self.assertCompiledMatches(rule_def, self.msg))
+        self.assertFalse(self.assertCompiledMatches(rule_def, self.recent_msg))
+
+    def test_shared_cache(self):
+        cache = {}
+        for rule_def in (
+            {"headers": [{"name": "Subject", "substring": "reply"}]},
+            {
+                "headers": [
+                    {"name": "subject", "value": "re: reply to previous message"}
+                ]
+            },
+        ):
+            predicate = rules.compile_rule(rules.factory(rule_def, {}))
+            self.assertTrue(predicate(self.msg, cache))
+        self.assertEqual([("subject", True)], list(cache))
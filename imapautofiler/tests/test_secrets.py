@@ -51,12 +51,20 @@ class TestKeyringPassword(unittest.TestCase):
         self.assertEqual(mock.sentinel.Password, self.fixture.get_password())
 
     def test_get_password_missing_sets_password(self):
-        self.get_password.side_effect = [None, mock.sentinel.Password]
-        self.assertEqual(mock.sentinel.Password, self.fixture.get_password())
+        self.get_password.return_value = None
+        self.assertEqual(self.getpass.return_value, self.fixture.get_password())
 
         self.set_password.assert_called_once_with(
             "hostname", "username", self.getpass.return_value
         )
+        self.get_password.assert_called_once_with("hostname", "username")
+
+    def test_get_password_cached(self):
+        self.get_password.return_value = mock.sentinel.Password
+
+        self.assertEqual(mock.sentinel.Password, self.fixture.get_password())
+        self.assertEqual(mock.sentinel.Password, self.fixture.get_password())
+        self.get_password.assert_called_once_with("hostname", "username")
 
 
 class TestGetSecretFromConfig(unittest.TestCase):